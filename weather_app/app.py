@@ -1,8 +1,9 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 import plotly.express as px
 from datetime import datetime
-from utils import fetch_weather_forecast, process_forecast_data, calculate_gdd
+from utils import get_daily_summary, calculate_gdd
 
 # Climate Normals for Plovdiv (Can be expanded or made farmer-specific if needed)
 NORMALS = {
@@ -32,19 +33,40 @@ CROP_DATA = {
     # Add more crops as needed
 }
 
+# Daily summary fields the full dashboard relies on
+REQUIRED_COLUMNS = frozenset({'min_temp', 'max_temp', 'avg_humidity', 'total_precipitation', 'avg_wind_speed', 'max_wind_gust', 'max_pop', 'avg_cloud_cover'})
+
+# Hide the Plotly modebar; the charts are for reading, not editing
+PLOTLY_CONFIG = {'displayModeBar': False}
+
+# Tabular views of the static data, built once per server process instead of per rerun
+@st.cache_resource(show_spinner=False)
+def _load_static_tables():
+    normals_df = pd.DataFrame.from_dict(NORMALS, orient='index')
+    # Months without frost data count as 0 frost days
+    normals_df['frost_days'] = normals_df['frost_days'].fillna(0).astype(int)
+    crop_df = pd.DataFrame.from_dict(CROP_DATA, orient='index')
+    return normals_df, crop_df
+
 # --- Streamlit App ---
 st.set_page_config(page_title="Farmer's Weather Dashboard", layout="wide")
 st.title("🌾 Farmer's Weather Dashboard")
 st.markdown("Weekly weather insights for agricultural planning.")
 
+NORMALS_DF, CROP_DF = _load_static_tables()
+
 # API Key Configuration
 st.sidebar.header("⚙️ Configuration")
 
-# Try to load API key from secrets
-api_key = ""
-if "OPENWEATHERMAP_API_KEY" in st.secrets and st.secrets["OPENWEATHERMAP_API_KEY"] != "YOUR_API_KEY_HERE" and st.secrets["OPENWEATHERMAP_API_KEY"]:
-    api_key = st.secrets["OPENWEATHERMAP_API_KEY"]
-else:
+# Try to load API key from secrets, once per server process rather than on every rerun
+@st.cache_resource(show_spinner=False)
+def _get_api_key():
+    key = st.secrets.get("OPENWEATHERMAP_API_KEY", "")
+    return key if key and key != "YOUR_API_KEY_HERE" else None
+
+api_key = _get_api_key()
+if api_key is None:
+    _get_api_key.clear() # Re-read secrets on the next run once the key is fixed
     st.sidebar.error("🛑 OpenWeatherMap API Key not found or is placeholder. ")
     st.sidebar.markdown("Please ensure `OPENWEATHERMAP_API_KEY` is correctly set in your `.streamlit/secrets.toml` file.")
     st.error("API Key not configured. Please check sidebar instructions.")
@@ -56,13 +78,13 @@ city_name = st.sidebar.text_input("Enter City Name", "Plovdiv")
 # Crop Selection
 selected_crop_name = st.sidebar.selectbox(
     "Select Crop for Analysis",
-    options=list(CROP_DATA.keys()),
+    options=CROP_DF.index.tolist(),
     index=0, # Default to Generic
     help="Selecting a crop will pre-fill the GDD Base Temperature. You can still adjust it manually."
 )
 
 # GDD Base Temperature Input - value updated by crop selection
-gdd_base_temp_default = CROP_DATA[selected_crop_name]["gdd_base"]
+gdd_base_temp_default = float(CROP_DF.at[selected_crop_name, "gdd_base"])
 gdd_base_temp = st.sidebar.number_input(
     "GDD Base Temperature (°C)",
     min_value=-10.0, max_value=30.0, value=gdd_base_temp_default, step=0.5,
@@ -71,7 +93,7 @@ gdd_base_temp = st.sidebar.number_input(
 
 # Month Selector (optional override)
 current_month_name = datetime.now().strftime("%B")
-available_months = list(NORMALS.keys())
+available_months = NORMALS_DF.index.tolist()
 if current_month_name not in available_months: # Fallback if current month not in NORMALS
     current_month_name = available_months[datetime.now().month -1]
 
@@ -81,41 +103,65 @@ selected_month = st.sidebar.selectbox(
     index=available_months.index(current_month_name) # Default to current month
 )
 
-# Cache data fetching
-@st.cache_data
+# Fetching and processing are cached per city inside utils.get_daily_summary
 def get_weather_data(api_key_param, city_name_param):
     if not api_key_param:
         return None, "API Key is missing."
     try:
-        forecast_json = fetch_weather_forecast(api_key_param, city_name_param)
-        return forecast_json, None
+        daily_summary = get_daily_summary(api_key_param, city_name_param)
+        return daily_summary, None
     except Exception as e:
         return None, f"Error fetching data: {e}"
 
+# Cache chart construction so reruns with unchanged data skip plotly.express;
+# bounded like the forecast fetch, since each refresh brings new data to key on
+@st.cache_data(ttl=900, max_entries=64, show_spinner=False)
+def build_line_chart(chart_df, y, title, labels, line_color=None):
+    # WebGL traces keep line charts responsive if the series grows to hourly data
+    fig = px.line(chart_df, x='date', y=y, title=title, labels=labels, markers=True, render_mode='webgl')
+    if line_color:
+        fig.update_traces(line_color=line_color)
+    return fig
+
+@st.cache_data(ttl=900, max_entries=64, show_spinner=False)
+def build_bar_chart(chart_df, y, title, labels, marker_color=None):
+    fig = px.bar(chart_df, x='date', y=y, title=title, labels=labels)
+    if marker_color:
+        fig.update_traces(marker_color=marker_color)
+    return fig
+
 if st.sidebar.button("🚜 Analyze Farm Weather"):
     if not api_key or not city_name:
         st.error("🚫 API Key or City Name is missing. Please check the sidebar.")
     else:
         with st.spinner(f"Fetching weather intelligence for {city_name}..."):
-            forecast_data, error_message = get_weather_data(api_key, city_name)
+            daily_summary, error_message = get_weather_data(api_key, city_name)
 
         if error_message:
             st.error(error_message)
-        elif forecast_data:
+        elif daily_summary:
             st.success(f"Successfully fetched weather data for {city_name}!")
 
-            daily_summary_df, rainy_days_count, overall_avg_temp, overall_avg_humidity = process_forecast_data(forecast_data)
+            daily_summary_df, rainy_days_count, overall_avg_temp, overall_avg_humidity = daily_summary
 
-            if daily_summary_df.empty or not all(col in daily_summary_df.columns for col in ['min_temp', 'max_temp', 'avg_humidity', 'total_precipitation', 'avg_wind_speed', 'max_wind_gust', 'max_pop', 'avg_cloud_cover']):
+            if daily_summary_df.empty or not REQUIRED_COLUMNS.issubset(daily_summary_df.columns):
                 st.warning("Could not process all required weather data fields. Some features might be unavailable.")
                 # Still try to calculate GDD if basic temp data is there
                 if 'min_temp' in daily_summary_df.columns and 'max_temp' in daily_summary_df.columns:
-                    daily_summary_df_with_gdd = calculate_gdd(daily_summary_df.copy(), gdd_base_temp)
+                    daily_summary_df_with_gdd = calculate_gdd(daily_summary_df, gdd_base_temp)
                 else:
-                    daily_summary_df_with_gdd = daily_summary_df.copy() # or an empty df with gdd columns
+                    daily_summary_df_with_gdd = daily_summary_df # or an empty df with gdd columns
             else:
-                daily_summary_df_with_gdd = calculate_gdd(daily_summary_df.copy(), gdd_base_temp)
+                daily_summary_df_with_gdd = calculate_gdd(daily_summary_df, gdd_base_temp)
             
+            # Format the dates once for every advisory below
+            forecast_dates = pd.to_datetime(daily_summary_df_with_gdd['date'])
+            daily_summary_df_with_gdd = daily_summary_df_with_gdd.assign(
+                date_long=forecast_dates.dt.strftime('%A, %B %d'),
+                date_short=forecast_dates.dt.strftime('%A, %b %d'),
+                weekday=forecast_dates.dt.strftime('%A')
+            )
+
             total_gdd_forecast = daily_summary_df_with_gdd['cumulative_gdd'].iloc[-1] if 'cumulative_gdd' in daily_summary_df_with_gdd and not daily_summary_df_with_gdd.empty else 0
 
             st.subheader("📅 7-Day Agricultural Weather Outlook")
@@ -131,7 +177,8 @@ if st.sidebar.button("🚜 Analyze Farm Weather"):
                     cols_for_display = ['date', 'min_temp', 'max_temp', 'avg_humidity', 'total_precipitation', 'gdd', 
                                         'avg_wind_speed', 'max_wind_gust', 'max_pop', 'avg_cloud_cover', 'avg_visibility']
                     available_cols = [col for col in cols_for_display if col in daily_summary_df_with_gdd.columns]
-                    display_df = daily_summary_df_with_gdd[available_cols].copy()
+                    # Columns with no data at all would only add empty payload to the table
+                    display_df = daily_summary_df_with_gdd[available_cols].dropna(axis=1, how='all')
                     
                     new_column_names = {
                         'date': 'Date', 'min_temp': 'Min Temp (°C)', 'max_temp': 'Max Temp (°C)',
@@ -141,20 +188,19 @@ if st.sidebar.button("🚜 Analyze Farm Weather"):
                         'avg_cloud_cover': 'Avg Clouds (%)',
                         'avg_visibility': 'Avg Visibility (m)'
                     }
-                    display_df.rename(columns=new_column_names, inplace=True)
+                    display_df = display_df.rename(columns=new_column_names)
                     
-                    column_formats = {}
-                    for col_name in display_df.columns:
-                        if col_name != 'Date':
-                            display_df[col_name] = pd.to_numeric(display_df[col_name], errors='coerce')
-                            if col_name == 'Avg Visibility (m)':
-                                column_formats[col_name] = "{:,.0f}"
-                            else:
-                                column_formats[col_name] = "{:.1f}"
+                    # process_forecast_data and calculate_gdd already return float columns, so no coercion is needed
+                    column_formats = {
+                        col_name: "{:,.0f}" if col_name == 'Avg Visibility (m)' else "{:.1f}"
+                        for col_name in display_df.columns if col_name != 'Date'
+                    }
                     
+                    # Hand Streamlit an Arrow table directly so it skips its own pandas conversion
                     st.dataframe(
-                        display_df.set_index('Date' if 'Date' in display_df.columns else None),
+                        pa.Table.from_pandas(display_df, preserve_index=False),
                         use_container_width=True,
+                        hide_index=True,
                         column_config=column_formats
                     )
                 else:
@@ -162,32 +208,32 @@ if st.sidebar.button("🚜 Analyze Farm Weather"):
 
             st.markdown("---")
             st.subheader("📊 Visualizations for Farm Planning")
-            charts_col1, charts_col2 = st.columns(2)
-
-            with charts_col1:
-                if 'date' in daily_summary_df_with_gdd.columns and all(c in daily_summary_df_with_gdd for c in ['min_temp', 'max_temp', 'avg_temp']):
-                    fig_temp = px.line(daily_summary_df_with_gdd, x='date', y=['min_temp', 'max_temp', 'avg_temp'], title='Daily Min, Max & Avg Temperatures (°C)', labels={'date': 'Date', 'value': 'Temperature (°C)'}, markers=True)
-                    st.plotly_chart(fig_temp, use_container_width=True)
-                if 'date' in daily_summary_df_with_gdd.columns and 'total_precipitation' in daily_summary_df_with_gdd.columns:
-                    fig_precip = px.bar(daily_summary_df_with_gdd, x='date', y='total_precipitation', title='Total Daily Precipitation (mm)', labels={'date': 'Date', 'total_precipitation': 'Precipitation (mm)'})
-                    fig_precip.update_traces(marker_color='#1E90FF')
-                    st.plotly_chart(fig_precip, use_container_width=True)
-                if 'date' in daily_summary_df_with_gdd.columns and all(c in daily_summary_df_with_gdd for c in ['avg_wind_speed', 'max_wind_gust']):
-                    fig_wind = px.line(daily_summary_df_with_gdd, x='date', y=['avg_wind_speed', 'max_wind_gust'], title='Daily Avg. Wind Speed & Max Gust (m/s)', labels={'date': 'Date', 'value': 'Wind Speed (m/s)'}, markers=True)
-                    st.plotly_chart(fig_wind, use_container_width=True)
-
-            with charts_col2:
-                if 'date' in daily_summary_df_with_gdd.columns and 'cumulative_gdd' in daily_summary_df_with_gdd.columns:
-                    fig_gdd = px.line(daily_summary_df_with_gdd, x='date', y='cumulative_gdd', title=f'Cumulative GDD for {selected_crop_name} (Base {gdd_base_temp}°C)', labels={'date': 'Date', 'cumulative_gdd': 'Cumulative GDD'}, markers=True)
-                    fig_gdd.update_traces(line_color='#228B22')
-                    st.plotly_chart(fig_gdd, use_container_width=True)
-                if 'date' in daily_summary_df_with_gdd.columns and 'avg_humidity' in daily_summary_df_with_gdd.columns:
-                    fig_humidity = px.line(daily_summary_df_with_gdd, x='date', y='avg_humidity', title='Average Daily Humidity (%)', labels={'date': 'Date', 'avg_humidity': 'Avg. Humidity (%)'}, markers=True)
-                    fig_humidity.update_traces(line_color='#87CEEB')
-                    st.plotly_chart(fig_humidity, use_container_width=True)
-                if 'date' in daily_summary_df_with_gdd.columns and all(c in daily_summary_df_with_gdd for c in ['max_pop', 'avg_cloud_cover']):
-                    fig_pop_clouds = px.line(daily_summary_df_with_gdd, x='date', y=['max_pop', 'avg_cloud_cover'], title='Max PoP & Avg Cloud Cover (%)', labels={'date': 'Date', 'value': 'Percentage (%)'}, markers=True)
-                    st.plotly_chart(fig_pop_clouds, use_container_width=True)
+            # Build every figure first, then render them together in one container
+            left_figs, right_figs = [], []
+            chart_cols = set(daily_summary_df_with_gdd.columns)
+            temp_cols = ['min_temp', 'max_temp', 'avg_temp']
+            wind_cols = ['avg_wind_speed', 'max_wind_gust']
+            pop_cloud_cols = ['max_pop', 'avg_cloud_cover']
+            if chart_cols.issuperset(['date', *temp_cols]):
+                left_figs.append(build_line_chart(daily_summary_df_with_gdd[['date', *temp_cols]], temp_cols, 'Daily Min, Max & Avg Temperatures (°C)', {'date': 'Date', 'value': 'Temperature (°C)'}))
+            if chart_cols.issuperset(['date', 'total_precipitation']):
+                left_figs.append(build_bar_chart(daily_summary_df_with_gdd[['date', 'total_precipitation']], 'total_precipitation', 'Total Daily Precipitation (mm)', {'date': 'Date', 'total_precipitation': 'Precipitation (mm)'}, marker_color='#1E90FF'))
+            if chart_cols.issuperset(['date', *wind_cols]):
+                left_figs.append(build_line_chart(daily_summary_df_with_gdd[['date', *wind_cols]], wind_cols, 'Daily Avg. Wind Speed & Max Gust (m/s)', {'date': 'Date', 'value': 'Wind Speed (m/s)'}))
+
+            if chart_cols.issuperset(['date', 'cumulative_gdd']):
+                right_figs.append(build_line_chart(daily_summary_df_with_gdd[['date', 'cumulative_gdd']], 'cumulative_gdd', f'Cumulative GDD for {selected_crop_name} (Base {gdd_base_temp}°C)', {'date': 'Date', 'cumulative_gdd': 'Cumulative GDD'}, line_color='#228B22'))
+            if chart_cols.issuperset(['date', 'avg_humidity']):
+                right_figs.append(build_line_chart(daily_summary_df_with_gdd[['date', 'avg_humidity']], 'avg_humidity', 'Average Daily Humidity (%)', {'date': 'Date', 'avg_humidity': 'Avg. Humidity (%)'}, line_color='#87CEEB'))
+            if chart_cols.issuperset(['date', *pop_cloud_cols]):
+                right_figs.append(build_line_chart(daily_summary_df_with_gdd[['date', *pop_cloud_cols]], pop_cloud_cols, 'Max PoP & Avg Cloud Cover (%)', {'date': 'Date', 'value': 'Percentage (%)'}))
+
+            with st.container():
+                charts_col1, charts_col2 = st.columns(2)
+                for charts_col, figs in ((charts_col1, left_figs), (charts_col2, right_figs)):
+                    with charts_col:
+                        for fig in figs:
+                            st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
             
             st.markdown("---")
             st.subheader(f"🌾 Agricultural Advisory for {selected_month} (and 7-day Outlook)")
@@ -198,12 +244,14 @@ if st.sidebar.button("🚜 Analyze Farm Weather"):
                 min_value=-5.0, max_value=10.0, value=2.0, step=0.5,
                 help="Set the temperature below which you consider a frost risk for your crops."
             )
-            frost_days_forecast = daily_summary_df_with_gdd[daily_summary_df_with_gdd['min_temp'] < frost_threshold_input]
-            if not frost_days_forecast.empty:
-                st.warning(f"🥶 FROST RISK: {len(frost_days_forecast)} day(s) in the next 7 days with minimum temperatures below {frost_threshold_input}°C.")
+            min_temps = daily_summary_df_with_gdd['min_temp'].to_numpy()
+            frost_mask = min_temps < frost_threshold_input
+            if frost_mask.any():
+                st.warning(f"🥶 FROST RISK: {int(frost_mask.sum())} day(s) in the next 7 days with minimum temperatures below {frost_threshold_input}°C.")
                 st.write("Dates with potential frost:")
-                for _, row in frost_days_forecast.iterrows():
-                    st.write(f"  - {row['date'].strftime('%A, %B %d')}: Min Temp {row['min_temp']:.1f}°C")
+                frost_dates = daily_summary_df_with_gdd.loc[frost_mask, 'date_long'].tolist()
+                for day_str, min_t in zip(frost_dates, min_temps[frost_mask]):
+                    st.write(f"  - {day_str}: Min Temp {min_t:.1f}°C")
                 st.markdown("Consider protective measures for sensitive crops.")
             else:
                 st.success(f"✅ No immediate frost risk (below {frost_threshold_input}°C) in the 7-day forecast.")
@@ -223,18 +271,20 @@ if st.sidebar.button("🚜 Analyze Farm Weather"):
                 gust_limit = 6.0 # m/s
                 
                 st.info("**Spraying Conditions Advisory (general guidance):**")
-                can_spray_days = []
-                caution_spray_days = []
-                for index, row in daily_summary_df_with_gdd.iterrows():
-                    day_str = row['date'].strftime('%A, %b %d')
-                    avg_ws = row['avg_wind_speed']
-                    max_g = row['max_wind_gust']
-                    if ideal_wind_lower <= avg_ws <= ideal_wind_upper and max_g < gust_limit:
-                        can_spray_days.append(f"{day_str} (Avg: {avg_ws:.1f} m/s, Gust: {max_g:.1f} m/s)")
-                    elif avg_ws < ideal_wind_lower:
-                        caution_spray_days.append(f"{day_str}: Low wind (potential drift issues if too calm or inversion). Avg: {avg_ws:.1f} m/s.") 
-                    else:
-                        caution_spray_days.append(f"{day_str}: High wind/gusts (risk of drift). Avg: {avg_ws:.1f} m/s, Gust: {max_g:.1f} m/s.")
+                day_strs = daily_summary_df_with_gdd['date_short'].to_numpy()
+                avg_ws = daily_summary_df_with_gdd['avg_wind_speed'].to_numpy()
+                max_g = daily_summary_df_with_gdd['max_wind_gust'].to_numpy()
+                ideal = (avg_ws >= ideal_wind_lower) & (avg_ws <= ideal_wind_upper) & (max_g < gust_limit)
+                low = avg_ws < ideal_wind_lower
+                can_spray_days = [
+                    f"{day_str} (Avg: {ws:.1f} m/s, Gust: {g:.1f} m/s)"
+                    for day_str, ws, g in zip(day_strs[ideal], avg_ws[ideal], max_g[ideal])
+                ]
+                caution_spray_days = [
+                    f"{day_str}: Low wind (potential drift issues if too calm or inversion). Avg: {ws:.1f} m/s." if is_low
+                    else f"{day_str}: High wind/gusts (risk of drift). Avg: {ws:.1f} m/s, Gust: {g:.1f} m/s."
+                    for day_str, ws, g, is_low in zip(day_strs[~ideal], avg_ws[~ideal], max_g[~ideal], low[~ideal])
+                ]
                 if can_spray_days:
                     st.success(f"🌬️ Favorable spraying windows on: {', '.join(can_spray_days)}. Always verify on-site.")
                 if caution_spray_days:
@@ -243,9 +293,9 @@ if st.sidebar.button("🚜 Analyze Farm Weather"):
 
             # Precipitation Chance
             if 'max_pop' in daily_summary_df_with_gdd.columns:
-                high_pop_days = daily_summary_df_with_gdd[daily_summary_df_with_gdd['max_pop'] > 60]
-                if not high_pop_days.empty:
-                    days_str = ", ".join(high_pop_days['date'].apply(lambda x: x.strftime('%A')))
+                high_pop_mask = daily_summary_df_with_gdd['max_pop'].to_numpy() > 60
+                if high_pop_mask.any():
+                    days_str = ", ".join(daily_summary_df_with_gdd.loc[high_pop_mask, 'weekday'].tolist())
                     st.info(f"💧 High chance of rain (PoP > 60%) on: {days_str}. Plan field activities accordingly.")
             
             # Drying Conditions
@@ -253,10 +303,10 @@ if st.sidebar.button("🚜 Analyze Farm Weather"):
             # ... (can add a simple heuristic based on low humidity, some wind, no rain)
 
             # Climate Normals Comparison (remains largely the same, but context is now 7-day outlook)
-            if selected_month in NORMALS:
-                norm_temp = NORMALS[selected_month]["temp"]
-                norm_rain_days = NORMALS[selected_month]["rain_days"]
-                norm_frost_days = NORMALS[selected_month].get("frost_days", 0)
+            if selected_month in NORMALS_DF.index:
+                norm_temp = NORMALS_DF.at[selected_month, "temp"]
+                norm_rain_days = NORMALS_DF.at[selected_month, "rain_days"]
+                norm_frost_days = NORMALS_DF.at[selected_month, "frost_days"]
 
                 st.markdown(f"**Climate Normals for {selected_month} in {city_name}:**")
                 st.markdown(f"- Avg. Temperature: {norm_temp}°C")
@@ -1,76 +1,208 @@
 # Helper functions for the Weather Analyzer App 
+import asyncio
+import time
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
-from datetime import datetime, date # Added date for type hinting
+from numba import njit
+import streamlit as st
+from datetime import date # Added date for type hinting
 
-def fetch_weather_forecast(api_key, city_name="Plovdiv"):
+# Copy-on-Write lets the app take column subsets without defensive copies.
+# It is always on from pandas 3.0, so only opt in on older versions.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+# Same connect/read limits as the synchronous (3.05, 10) timeout
+_ASYNC_TIMEOUT = httpx.Timeout(10, connect=3.05)
+
+# Retry policy shared by the sync session and the async fetch
+_RETRY_TOTAL = 2
+_RETRY_BACKOFF = 0.3
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Shared session so repeated fetches reuse the warm TLS connection to OpenWeatherMap
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=2, pool_maxsize=4,
+    max_retries=Retry(total=_RETRY_TOTAL, backoff_factor=_RETRY_BACKOFF, status_forcelist=list(_RETRY_STATUSES))
+))
+
+# Async forecasts kept for the same 15 minutes as fetch_weather_forecast's cache: city_name -> (fetched_at, forecast)
+_ASYNC_CACHE_TTL = 900
+_async_cache = {}
+
+# Forecasts refresh roughly hourly upstream; the leading underscore keeps the API key out of the cache key
+@st.cache_data(ttl=900, show_spinner=False)
+def fetch_weather_forecast(_api_key, city_name="Plovdiv"):
     """Fetches 5-day/3-hour weather forecast from OpenWeatherMap API."""
-    base_url = "http://api.openweathermap.org/data/2.5/forecast"
+    params = {
+        "q": city_name,
+        "appid": _api_key,
+        "units": "metric"
+    }
+    response = _SESSION.get(FORECAST_URL, params=params, timeout=(3.05, 10))
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    return orjson.loads(response.content)
+
+def _async_client():
+    """AsyncClient with the sync session's timeout; the transport retries failed connections."""
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(http2=True, retries=_RETRY_TOTAL),
+        timeout=_ASYNC_TIMEOUT
+    )
+
+async def fetch_weather_forecast_async(api_key, city_name="Plovdiv", client=None):
+    """Fetches the forecast without blocking the event loop, over `client` when one is given."""
+    if client is None:
+        async with _async_client() as own_client:
+            return await fetch_weather_forecast_async(api_key, city_name, own_client)
     params = {
         "q": city_name,
         "appid": api_key,
         "units": "metric"
     }
-    response = requests.get(base_url, params=params)
+    # Retry rate limits and server errors with the same backoff as the sync session
+    for attempt in range(_RETRY_TOTAL + 1):
+        response = await client.get(FORECAST_URL, params=params)
+        if response.status_code not in _RETRY_STATUSES or attempt == _RETRY_TOTAL:
+            break
+        await asyncio.sleep(_RETRY_BACKOFF * 2 ** attempt)
     response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
+    return orjson.loads(response.content)
+
+def fetch_weather_forecasts(api_key, city_names):
+    """Fetches forecasts for several cities concurrently, returned as a dict keyed by city name.
+    All requests share one HTTP/2 connection, so wall time is close to a single round trip.
+    A city that fails (e.g. unknown name) maps to the raised exception instead of a forecast,
+    so one bad city doesn't discard the others. Successful forecasts are reused for 15 minutes.
+    """
+    cities = list(dict.fromkeys(city_names))
+    now = time.monotonic()
+    for city, (fetched_at, _) in list(_async_cache.items()):
+        if now - fetched_at >= _ASYNC_CACHE_TTL:
+            _async_cache.pop(city, None)
+
+    results = {city: _async_cache[city][1] for city in cities if city in _async_cache}
+    missing = [city for city in cities if city not in results]
+
+    async def fetch_all():
+        async with _async_client() as client:
+            return await asyncio.gather(
+                *(fetch_weather_forecast_async(api_key, city, client) for city in missing),
+                return_exceptions=True
+            )
+    if missing:
+        for city, result in zip(missing, asyncio.run(fetch_all())):
+            results[city] = result
+            if not isinstance(result, BaseException):
+                _async_cache[city] = (now, result)
+    return {city: results[city] for city in cities}
+
+# Per-slot fields read from the forecast payload, in the order _extract_slots yields them.
+# float32 is ample for 0.1°C / 0.1 mm readings and halves the bytes moved per column.
+_SLOT_DTYPE = np.dtype([
+    ('dt', np.int64), ('temp', np.float32), ('temp_min', np.float32), ('temp_max', np.float32),
+    ('humidity', np.float32), ('precipitation', np.float32), ('wind_speed', np.float32),
+    ('wind_gust', np.float32), ('pop', np.float32), ('cloud_cover', np.float32), ('visibility', np.float32)
+])
+
+# Shared read-only stand-in for absent nested objects, so lookups don't allocate a new {} each time
+_EMPTY = {}
+
+def _extract_slots(items):
+    """Yields one flat tuple per 3-hour forecast slot holding only the fields we aggregate."""
+    for item in items:
+        main = item['main']
+        wind = item.get('wind') or _EMPTY
+        yield (
+            item['dt'], main['temp'], main['temp_min'], main['temp_max'], main['humidity'],
+            (item.get('rain') or _EMPTY).get('3h', 0), wind.get('speed', 0), wind.get('gust', 0),
+            item.get('pop', 0) * 100, (item.get('clouds') or _EMPTY).get('all', 0), item.get('visibility', 10000)
+        )
+
+# Daily summary columns returned when there is no forecast to aggregate
+_EMPTY_COLS = ('date', 'avg_temp', 'min_temp', 'max_temp', 'avg_humidity',
+               'total_precipitation', 'avg_wind_speed', 'max_wind_speed', 'max_wind_gust',
+               'max_pop', 'avg_cloud_cover', 'avg_visibility')
 
 def process_forecast_data(forecast_data):
     """Processes raw forecast data to get daily aggregates relevant for farmers."""
-    if not forecast_data or 'list' not in forecast_data:
-        cols = ['date', 'avg_temp', 'min_temp', 'max_temp', 'avg_humidity', 
-                'total_precipitation', 'avg_wind_speed', 'max_wind_speed', 'max_wind_gust',
-                'max_pop', 'avg_cloud_cover', 'avg_visibility']
-        return pd.DataFrame(columns=cols), 0, 0.0, 0.0
-
-    processed_data = []
-    for item in forecast_data['list']:
-        dt_object = datetime.fromtimestamp(item['dt'])
-        processed_data.append({
-            'datetime': dt_object,
-            'date': dt_object.date(),
-            'temp': item['main']['temp'],
-            'temp_min_3hr': item['main']['temp_min'],
-            'temp_max_3hr': item['main']['temp_max'],
-            'humidity': item['main']['humidity'],
-            'precipitation': item.get('rain', {}).get('3h', 0),
-            'wind_speed': item.get('wind', {}).get('speed', 0),
-            'wind_gust': item.get('wind', {}).get('gust', 0),
-            'pop': item.get('pop', 0) * 100,
-            'cloud_cover': item.get('clouds', {}).get('all', 0),
-            'visibility': item.get('visibility', 10000)
-        })
-
-    if not processed_data:
-        cols = ['date', 'avg_temp', 'min_temp', 'max_temp', 'avg_humidity', 
-                'total_precipitation', 'avg_wind_speed', 'max_wind_speed', 'max_wind_gust',
-                'max_pop', 'avg_cloud_cover', 'avg_visibility']
-        return pd.DataFrame(columns=cols), 0, 0.0, 0.0
-
-    df = pd.DataFrame(processed_data)
-
-    daily_summary = df.groupby('date').agg(
-        avg_temp=('temp', 'mean'),
-        min_temp=('temp_min_3hr', 'min'),
-        max_temp=('temp_max_3hr', 'max'),
-        avg_humidity=('humidity', 'mean'),
-        total_precipitation=('precipitation', 'sum'),
-        avg_wind_speed=('wind_speed', 'mean'),
-        max_wind_speed=('wind_speed', 'max'),
-        max_wind_gust=('wind_gust', 'max'),
-        max_pop=('pop', 'max'),
-        avg_cloud_cover=('cloud_cover', 'mean'),
-        avg_visibility=('visibility', 'mean')
-    ).reset_index()
-
-    daily_summary = daily_summary.head(7)
-
-    rainy_days_count = daily_summary[daily_summary['total_precipitation'] > 0]['date'].nunique()
-    overall_avg_temp = daily_summary['avg_temp'].mean() if not daily_summary.empty else 0.0
-    overall_avg_humidity = daily_summary['avg_humidity'].mean() if not daily_summary.empty else 0.0
+    if not forecast_data or not forecast_data.get('list'):
+        return pd.DataFrame(columns=list(_EMPTY_COLS)), 0, 0.0, 0.0
+
+    items = forecast_data['list']
+
+    # Bucket slots into days in the city's local time (UTC offset in seconds from the API)
+    utc_offset = forecast_data.get('city', {}).get('timezone', 0)
+    slots = np.fromiter(_extract_slots(items), dtype=_SLOT_DTYPE, count=len(items))
+    day_keys = (slots['dt'] + utc_offset) // 86400
+
+    # Forecast slots arrive sorted by time, so each day is a contiguous run of slots
+    # and every daily aggregate is a single reduceat over the run start indices.
+    starts = np.flatnonzero(np.r_[True, day_keys[1:] != day_keys[:-1]])
+
+    # Keep the first 7 days only, trimming slots before aggregating anything
+    if len(starts) > 7:
+        slots, day_keys, starts = slots[:starts[7]], day_keys[:starts[7]], starts[:7]
+    counts = np.diff(np.r_[starts, len(day_keys)]).astype(np.float32)
+
+    daily_summary = pd.DataFrame({
+        'date': pd.to_datetime(day_keys[starts], unit='D').date,
+        'avg_temp': np.add.reduceat(slots['temp'], starts) / counts,
+        'min_temp': np.minimum.reduceat(slots['temp_min'], starts),
+        'max_temp': np.maximum.reduceat(slots['temp_max'], starts),
+        'avg_humidity': np.add.reduceat(slots['humidity'], starts) / counts,
+        'total_precipitation': np.add.reduceat(slots['precipitation'], starts),
+        'avg_wind_speed': np.add.reduceat(slots['wind_speed'], starts) / counts,
+        'max_wind_speed': np.maximum.reduceat(slots['wind_speed'], starts),
+        'max_wind_gust': np.maximum.reduceat(slots['wind_gust'], starts),
+        'max_pop': np.maximum.reduceat(slots['pop'], starts),
+        'avg_cloud_cover': np.add.reduceat(slots['cloud_cover'], starts) / counts,
+        'avg_visibility': np.add.reduceat(slots['visibility'], starts) / counts
+    })
+
+    # One row per date after aggregation, so counting wet rows counts rainy days
+    rainy_days_count = int(np.count_nonzero(daily_summary['total_precipitation'].to_numpy() > 0))
+    # Average over every 3-hour slot in the window rather than over daily means,
+    # so partial first/last days don't carry the same weight as full ones
+    overall_avg_temp = float(slots['temp'].mean())
+    overall_avg_humidity = float(slots['humidity'].mean())
 
     return daily_summary, rainy_days_count, overall_avg_temp, overall_avg_humidity
 
+# Memoized per city next to the fetch, so widget reruns skip the pipeline without hashing the payload
+@st.cache_data(ttl=900, max_entries=64, show_spinner=False)
+def get_daily_summary(_api_key, city_name="Plovdiv"):
+    """Fetches the forecast for a city and returns process_forecast_data's result, or None if the API returned nothing."""
+    forecast_data = fetch_weather_forecast(_api_key, city_name)
+    return process_forecast_data(forecast_data) if forecast_data else None
+
+@njit(cache=True, fastmath=True)
+def _gdd_kernel(t_min, t_max, base):
+    """Daily and cumulative GDD in a single pass over float32 min/max arrays."""
+    n = t_min.shape[0]
+    gdd = np.empty(n, np.float32)
+    cumulative = np.empty(n, np.float32)
+    acc = np.float32(0.0)
+    for i in range(n):
+        # If T_max itself is less than base_temp, GDD is 0; otherwise T_min cannot go below base_temp
+        if t_max[i] < base:
+            v = np.float32(0.0)
+        else:
+            v = np.float32(0.5) * (t_max[i] + max(t_min[i], base)) - base
+            if v < 0:
+                v = np.float32(0.0)
+        gdd[i] = v
+        acc += v
+        cumulative[i] = acc
+    return gdd, cumulative
+
 def calculate_gdd(daily_df, base_temp):
     """Calculates Growing Degree Days (GDD) for each day and cumulative GDD.
     GDD = ((T_max + T_min) / 2) - T_base
@@ -81,25 +213,9 @@ def calculate_gdd(daily_df, base_temp):
     if daily_df.empty or not all(col in daily_df.columns for col in ['min_temp', 'max_temp']):
         return daily_df # Return original df if columns are missing
     
-    gdd_series = []
-    for index, row in daily_df.iterrows():
-        t_max = row['max_temp']
-        t_min = row['min_temp']
-
-        # Adjust T_min: if T_min < base_temp, use base_temp for GDD calculation part
-        # However, if T_max itself is less than base_temp, GDD is 0.
-        if t_max < base_temp:
-            daily_gdd = 0.0
-        else:
-            # Effective T_min for GDD calculation (cannot go below base_temp)
-            eff_t_min = max(t_min, base_temp)
-            avg_daily_temp_for_gdd = (t_max + eff_t_min) / 2
-            if avg_daily_temp_for_gdd < base_temp:
-                 daily_gdd = 0.0
-            else:
-                 daily_gdd = avg_daily_temp_for_gdd - base_temp
-        gdd_series.append(daily_gdd)
-    
-    daily_df['gdd'] = gdd_series
-    daily_df['cumulative_gdd'] = daily_df['gdd'].cumsum()
-    return daily_df 
\ No newline at end of file
+    t_min = daily_df['min_temp'].to_numpy(dtype=np.float32)
+    t_max = daily_df['max_temp'].to_numpy(dtype=np.float32)
+    gdd, cumulative_gdd = _gdd_kernel(t_min, t_max, np.float32(base_temp))
+
+    # assign returns a new frame, so callers don't need to copy beforehand
+    return daily_df.assign(gdd=gdd, cumulative_gdd=cumulative_gdd)